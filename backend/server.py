@@ -1,23 +1,52 @@
 from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+
+# Keep native per-call thread pools small; concurrency comes from CV_EXECUTOR
+# running several image jobs at once. Must be set before numpy/OpenCV load.
+CV_NATIVE_THREADS = 2
+os.environ.setdefault('OMP_NUM_THREADS', str(CV_NATIVE_THREADS))
+os.environ.setdefault('OPENBLAS_NUM_THREADS', str(CV_NATIVE_THREADS))
+
 import logging
+import math
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Optional, Dict, Any, Tuple
 import uuid
 from datetime import datetime
-import base64
+import pybase64
 import io
 import numpy as np
-from PIL import Image
 import cv2
-from scipy import ndimage, stats
-from skimage import filters, morphology, measure, feature
-from skimage.metrics import structural_similarity as ssim
+from PIL import Image as PILImage
+from numba import njit
+from skimage import morphology
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch, mm
+from reportlab.lib import colors
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+
+cv2.setNumThreads(CV_NATIVE_THREADS)
+
+# Shared pool for CPU-bound image work (OpenCV/NumPy release the GIL)
+CV_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(2, (os.cpu_count() or 2) // CV_NATIVE_THREADS),
+    thread_name_prefix='cv'
+)
+
+# PDF builds get their own small thread pool so report requests never
+# queue behind (or hold up) image work on CV_EXECUTOR. They stay in this
+# process so decode_report_image's cache is shared by every request
+PDF_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pdf')
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -66,6 +95,13 @@ class ComparisonResult(BaseModel):
     verdict_color: str
     ai_analysis: Optional[str] = None
 
+# Fields read by /history; everything else (sub_scores, ai_analysis) stays in the DB.
+# Thumbnails live in the thumbs collection; only older documents still hold them inline.
+HISTORY_PROJECTION = {
+    '_id': 0, 'id': 1, 'timestamp': 1, 'composite_score': 1,
+    'verdict': 1, 'verdict_color': 1, 'questioned_thumb': 1, 'known_thumb': 1
+}
+
 class ComparisonHistory(BaseModel):
     id: str
     timestamp: datetime
@@ -75,41 +111,85 @@ class ComparisonHistory(BaseModel):
     questioned_thumb: str
     known_thumb: str
 
+# Validates a whole /history page in one call
+HISTORY_ADAPTER = TypeAdapter(List[ComparisonHistory])
+
 # ============== IMAGE PROCESSING ==============
 
-def base64_to_image(base64_str: str) -> np.ndarray:
-    """Convert base64 string to numpy array (OpenCV format)"""
+def base64_to_bytes(base64_str: str) -> bytes:
+    """Decode a base64 string (optionally a data URL) to the encoded image file bytes"""
     try:
         # Remove data URL prefix if present
         if ',' in base64_str:
             base64_str = base64_str.split(',')[1]
-        
-        img_data = base64.b64decode(base64_str)
-        img = Image.open(io.BytesIO(img_data))
-        img = img.convert('RGB')
-        return np.array(img)
+        return pybase64.b64decode(base64_str)
     except Exception as e:
         logger.error(f"Error decoding base64 image: {e}")
         raise HTTPException(status_code=400, detail="Invalid image data")
 
-def image_to_base64(img: np.ndarray, format='PNG') -> str:
-    """Convert numpy array to base64 string"""
-    if len(img.shape) == 2:  # Grayscale
-        pil_img = Image.fromarray(img.astype(np.uint8), mode='L')
-    else:
-        pil_img = Image.fromarray(img.astype(np.uint8))
+def decode_image_bytes(data: bytes) -> np.ndarray:
+    """Decode encoded image file bytes to an RGB numpy array"""
+    try:
+        img_data = np.frombuffer(data, dtype=np.uint8)
+        # Ignore EXIF orientation so pixel coordinates match what PIL used to return
+        img = cv2.imdecode(img_data, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if img is None:
+            raise ValueError("Unsupported image format")
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    except Exception as e:
+        logger.error(f"Error decoding base64 image: {e}")
+        raise HTTPException(status_code=400, detail="Invalid image data")
+
+def base64_to_image(base64_str: str) -> np.ndarray:
+    """Convert base64 string to numpy array (OpenCV format)"""
+    return decode_image_bytes(base64_to_bytes(base64_str))
+
+def image_header_size(data: bytes) -> Tuple[int, int]:
+    """(width, height) of encoded image bytes, read from the file header only"""
+    try:
+        # PIL parses the header lazily; no pixel data is decoded here
+        with PILImage.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception as e:
+        logger.error(f"Error reading image header: {e}")
+        raise HTTPException(status_code=400, detail="Invalid image data")
+
+# cv2.imencode extension and parameters per output format. PNG level 3 is
+# roughly twice as fast as the default 6 for a slightly larger preview.
+ENCODE_PARAMS = {
+    'PNG': ('.png', [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+    'JPEG': ('.jpg', [cv2.IMWRITE_JPEG_QUALITY, 85]),
+}
+# Thumbnails are <=150px previews stored in every history document
+THUMBNAIL_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 70, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+def image_to_base64(img: np.ndarray, format='PNG', params: Optional[List[int]] = None) -> str:
+    """Convert numpy array (grayscale, RGB or RGBA) to base64 string"""
+    img = img.astype(np.uint8, copy=False)
+    if len(img.shape) == 3:  # OpenCV encodes BGR(A)
+        code = cv2.COLOR_RGBA2BGRA if img.shape[2] == 4 else cv2.COLOR_RGB2BGR
+        img = cv2.cvtColor(img, code)
     
-    buffer = io.BytesIO()
-    pil_img.save(buffer, format=format, quality=85)
-    return base64.b64encode(buffer.getvalue()).decode()
+    ext, default_params = ENCODE_PARAMS[format]
+    ok, buffer = cv2.imencode(ext, img, default_params if params is None else params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {format}")
+    return pybase64.b64encode(buffer).decode()
 
 def create_thumbnail(img: np.ndarray, max_size: int = 150) -> str:
     """Create a thumbnail of the image"""
     h, w = img.shape[:2]
+    if max(h, w) <= max_size:  # Already small enough, never upscale
+        return image_to_base64(img, 'JPEG', THUMBNAIL_JPEG_PARAMS)
+    
     scale = min(max_size / w, max_size / h)
     new_w, new_h = int(w * scale), int(h * scale)
+    # Halve large photos with pyrDown first; the final INTER_AREA pass then
+    # only has to average a small neighbourhood
+    while min(img.shape[:2]) > max_size * 2:
+        img = cv2.pyrDown(img)
     resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-    return image_to_base64(resized, 'JPEG')
+    return image_to_base64(resized, 'JPEG', THUMBNAIL_JPEG_PARAMS)
 
 def preprocess_image(img: np.ndarray) -> Dict[str, Any]:
     """Apply all preprocessing steps to handwriting image"""
@@ -117,22 +197,31 @@ def preprocess_image(img: np.ndarray) -> Dict[str, Any]:
     if len(img.shape) == 3:
         gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
     else:
-        gray = img.copy()
-    
-    # 2. High-pass sharpening / unsharp mask
-    blurred = cv2.GaussianBlur(gray, (0, 0), 3)
-    sharpened = cv2.addWeighted(gray, 1.5, blurred, -0.5, 0)
+        gray = img  # Read-only below: every step writes to a new buffer
+    return _preprocess_from_gray(gray)
+
+def _preprocess_from_gray(gray: np.ndarray) -> Dict[str, Any]:
+    """Preprocessing steps 2-5 for an already-grayscale image"""
+    # 2. High-pass sharpening / unsharp mask (blur buffer is reused for the result)
+    sharpened = cv2.GaussianBlur(gray, (0, 0), 3)
+    cv2.addWeighted(gray, 1.5, sharpened, -0.5, 0, dst=sharpened)
     
-    # 3. Adaptive binarization (Sauvola-like using OpenCV)
+    # 3. Adaptive binarization (Sauvola-like using OpenCV), thresholded in
+    # place since the sharpened image is not needed afterwards
     binary = cv2.adaptiveThreshold(
         sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV, 21, 10
+        cv2.THRESH_BINARY_INV, 21, 10, dst=sharpened
     )
     
     # 4. Basic deskew using moments
-    coords = np.column_stack(np.where(binary > 0))
-    if len(coords) > 100:
-        angle = cv2.minAreaRect(coords)[-1]
+    # minAreaRect needs (x, y) points as findNonZero returns them. Its hull step
+    # is much faster on points sorted by their first coordinate, so the hull is
+    # taken on (row, col) points (findNonZero's row-major order) and only the
+    # hull vertices are swapped back to (x, y).
+    coords = cv2.findNonZero(binary)
+    if coords is not None and len(coords) > 100:
+        hull = cv2.convexHull(np.ascontiguousarray(coords.reshape(-1, 2)[:, ::-1]))
+        angle = cv2.minAreaRect(np.ascontiguousarray(hull.reshape(-1, 2)[:, ::-1]))[-1]
         if angle < -45:
             angle = 90 + angle
         if abs(angle) > 0.5 and abs(angle) < 15:  # Only correct reasonable angles
@@ -149,27 +238,33 @@ def preprocess_image(img: np.ndarray) -> Dict[str, Any]:
     new_w = int(w * scale)
     normalized = cv2.resize(binary, (new_w, target_height), interpolation=cv2.INTER_AREA)
     
+    # Half-resolution binary for the contour-based slant / letter-ratio means,
+    # which barely move at 2x but cost a quarter as much to trace
+    binary_small = cv2.resize(binary, (max(1, binary.shape[1] // 2), max(1, binary.shape[0] // 2)),
+                              interpolation=cv2.INTER_NEAREST)
+    
     # Create skeleton for stroke analysis
-    skeleton = morphology.skeletonize(normalized > 0).astype(np.uint8) * 255
+    skeleton_mask = morphology.skeletonize(normalized > 0)
+    skeleton = skeleton_mask.astype(np.uint8) * 255
     
     return {
-        'gray': gray,
-        'sharpened': sharpened,
         'binary': binary,
+        'binary_small': binary_small,
         'normalized': normalized,
-        'skeleton': skeleton
+        'skeleton': skeleton,
+        'skeleton_mask': skeleton_mask  # bool, shared by the stroke/connectivity features
     }
 
 # ============== ANALYSIS FUNCTIONS ==============
 
-def calculate_slant_angle(binary: np.ndarray) -> float:
+def calculate_slant_angle(binary: np.ndarray, min_area: float = 50) -> float:
     """Calculate overall slant angle of handwriting"""
     try:
         # Find contours and calculate average angle
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         angles = []
         for cnt in contours:
-            if cv2.contourArea(cnt) > 50:
+            if cv2.contourArea(cnt) > min_area:
                 rect = cv2.minAreaRect(cnt)
                 angle = rect[-1]
                 if angle < -45:
@@ -179,35 +274,31 @@ def calculate_slant_angle(binary: np.ndarray) -> float:
     except:
         return 0
 
-def calculate_letter_ratio(binary: np.ndarray) -> float:
+def calculate_letter_ratio(binary: np.ndarray, min_width: int = 5, min_height: int = 10) -> float:
     """Calculate average width/height ratio of characters"""
     try:
-        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        ratios = []
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            if w > 5 and h > 10 and h < binary.shape[0] * 0.8:
-                ratios.append(w / h)
-        return np.mean(ratios) if ratios else 0.5
+        # Component bounding boxes in one labelling pass (background is label 0)
+        _, _, comp_stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        w = comp_stats[1:, cv2.CC_STAT_WIDTH]
+        h = comp_stats[1:, cv2.CC_STAT_HEIGHT]
+        valid = (w > min_width) & (h > min_height) & (h < binary.shape[0] * 0.8)
+        return np.mean(w[valid] / h[valid]) if valid.any() else 0.5
     except:
         return 0.5
 
 def calculate_line_spacing(binary: np.ndarray) -> float:
     """Calculate average line spacing from projection profile"""
     try:
-        projection = np.sum(binary, axis=1)
-        # Find peaks (text lines)
-        peaks = []
+        # Row sums with an int32 accumulator (rows are at most a few thousand px)
+        projection = cv2.reduce(binary, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+        # Find peaks (text lines) from rising/falling edges of the thresholded profile
         threshold = np.max(projection) * 0.1
-        in_peak = False
-        peak_start = 0
-        for i, val in enumerate(projection):
-            if val > threshold and not in_peak:
-                in_peak = True
-                peak_start = i
-            elif val <= threshold and in_peak:
-                in_peak = False
-                peaks.append((peak_start + i) // 2)
+        above = np.concatenate(([0], (projection > threshold).astype(np.int8)))
+        edges = np.diff(above)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        # A peak still open at the bottom edge is not counted
+        peaks = (starts[:len(ends)] + ends) // 2
         
         if len(peaks) > 1:
             spacings = np.diff(peaks)
@@ -216,63 +307,131 @@ def calculate_line_spacing(binary: np.ndarray) -> float:
     except:
         return 0.1
 
-def calculate_stroke_width_distribution(skeleton: np.ndarray, binary: np.ndarray) -> np.ndarray:
+STROKE_WIDTH_BINS = 20  # 1px bins over [0, 20)
+
+def calculate_stroke_width_distribution(skeleton: np.ndarray, binary: np.ndarray,
+                                        skeleton_mask: Optional[np.ndarray] = None) -> np.ndarray:
     """Calculate stroke width distribution using distance transform"""
     try:
+        if skeleton_mask is None:
+            skeleton_mask = skeleton > 0
         dist_transform = cv2.distanceTransform(binary, cv2.DIST_L2, 5)
-        skeleton_points = skeleton > 0
-        stroke_widths = dist_transform[skeleton_points]
-        stroke_widths = stroke_widths[stroke_widths > 0]
+        # Every skeleton pixel lies on the foreground, so its distance is >= 1
+        stroke_widths = dist_transform[skeleton_mask]
         if len(stroke_widths) > 10:
-            hist, _ = np.histogram(stroke_widths, bins=20, range=(0, 20), density=True)
-            return hist
-        return np.zeros(20)
+            # Same binning as np.histogram(bins=20, range=(0, 20), density=True):
+            # floor into 1px bins, 20.0 joins the last bin, wider strokes are dropped
+            in_range = stroke_widths[stroke_widths <= STROKE_WIDTH_BINS]
+            bins = np.minimum(in_range.astype(np.intp), STROKE_WIDTH_BINS - 1)
+            counts = np.bincount(bins, minlength=STROKE_WIDTH_BINS)
+            if counts.sum():
+                return counts / counts.sum()
+        return np.zeros(STROKE_WIDTH_BINS)
     except:
-        return np.zeros(20)
+        return np.zeros(STROKE_WIDTH_BINS)
+
+@njit(cache=True, nogil=True)
+def _curvature_accumulate(points: np.ndarray, bounds: np.ndarray):
+    """Sum, sum of squares, max and count of |turning angle| over all contours
+
+    points holds every contour back to back; contour c is points[bounds[c]:bounds[c+1]].
+    """
+    total = 0.0
+    total_sq = 0.0
+    peak = 0.0
+    count = 0
+    for c in range(len(bounds) - 1):
+        start, stop = bounds[c], bounds[c + 1]
+        if stop - start <= 10:
+            continue
+        # Curvature at each point (p1=i-2, p2=i, p3=i+2): the turning angle
+        # between v1 = p2 - p1 and v2 = p3 - p2, taken as atan2(cross, dot) so
+        # it stays in [0, pi] instead of wrapping to ~2*pi across the +/-x axis
+        for i in range(start + 2, stop - 2):
+            v1x = points[i, 0] - points[i-2, 0]
+            v1y = points[i, 1] - points[i-2, 1]
+            v2x = points[i+2, 0] - points[i, 0]
+            v2y = points[i+2, 1] - points[i, 1]
+            angle = abs(math.atan2(v1x * v2y - v1y * v2x, v1x * v2x + v1y * v2y))
+            total += angle
+            total_sq += angle * angle
+            if angle > peak:
+                peak = angle
+            count += 1
+    return total, total_sq, peak, count
 
 def calculate_curvature_stats(skeleton: np.ndarray) -> Dict[str, float]:
     """Calculate stroke curvature statistics"""
     try:
         contours, _ = cv2.findContours(skeleton, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
-        all_curvatures = []
-        
-        for cnt in contours:
-            if len(cnt) > 10:
-                cnt = cnt.squeeze()
-                if len(cnt.shape) == 2:
-                    # Calculate curvature at each point
-                    for i in range(2, len(cnt) - 2):
-                        p1 = cnt[i-2]
-                        p2 = cnt[i]
-                        p3 = cnt[i+2]
-                        v1 = p2 - p1
-                        v2 = p3 - p2
-                        angle = np.arctan2(v2[1], v2[0]) - np.arctan2(v1[1], v1[0])
-                        all_curvatures.append(abs(angle))
-        
-        if all_curvatures:
-            return {
-                'mean': float(np.mean(all_curvatures)),
-                'std': float(np.std(all_curvatures)),
-                'max': float(np.max(all_curvatures))
-            }
+        if contours:
+            points = np.concatenate(contours).reshape(-1, 2)
+            bounds = np.zeros(len(contours) + 1, dtype=np.int64)
+            np.cumsum([len(cnt) for cnt in contours], out=bounds[1:])
+            total, total_sq, peak, count = _curvature_accumulate(points, bounds)
+            if count:
+                mean = total / count
+                return {
+                    'mean': float(mean),
+                    'std': float(math.sqrt(max(total_sq / count - mean * mean, 0.0))),
+                    'max': float(peak)
+                }
         return {'mean': 0, 'std': 0, 'max': 0}
     except:
         return {'mean': 0, 'std': 0, 'max': 0}
 
-def calculate_connectivity_features(skeleton: np.ndarray) -> Dict[str, float]:
+@njit(cache=True, nogil=True)
+def _reflect_101(i: int, n: int) -> int:
+    """OpenCV BORDER_REFLECT_101 index for one step outside [0, n)"""
+    if n == 1:
+        return 0
+    if i < 0:
+        return 1
+    if i >= n:
+        return n - 2
+    return i
+
+# Serial on purpose: samples are analysed in worker threads, and numba's default
+# workqueue threading layer aborts on concurrent parallel=True launches
+@njit(cache=True, nogil=True)
+def _count_skeleton_points(mask: np.ndarray):
+    """Count branch, end and total skeleton pixels in a 0/1 mask"""
+    h, w = mask.shape
+    branch = 0
+    end = 0
+    total = 0
+    for i in range(h):
+        up = _reflect_101(i - 1, h)
+        down = _reflect_101(i + 1, h)
+        for j in range(w):
+            if mask[i, j]:
+                left = _reflect_101(j - 1, w)
+                right = _reflect_101(j + 1, w)
+                n = (mask[up, left] + mask[up, j] + mask[up, right] +
+                     mask[i, left] + mask[i, right] +
+                     mask[down, left] + mask[down, j] + mask[down, right])
+                total += 1
+                if n > 2:
+                    branch += 1
+                elif n == 1:
+                    end += 1
+    return branch, end, total
+
+def calculate_connectivity_features(skeleton: np.ndarray,
+                                    skeleton_mask: Optional[np.ndarray] = None) -> Dict[str, float]:
     """Calculate connectivity and branch point features"""
     try:
-        # Label connected components
-        labeled, num_components = measure.label(skeleton > 0, return_num=True)
+        if skeleton_mask is None:
+            skeleton_mask = skeleton > 0
+        mask = skeleton_mask.view(np.uint8)  # 0/1 without a copy
         
-        # Count branch points (pixels with more than 2 neighbors)
-        kernel = np.ones((3, 3), dtype=np.uint8)
-        neighbors = cv2.filter2D((skeleton > 0).astype(np.uint8), -1, kernel) - 1
-        branch_points = np.sum((skeleton > 0) & (neighbors > 2))
-        end_points = np.sum((skeleton > 0) & (neighbors == 1))
+        # Label connected components (8-connectivity, minus the background label)
+        num_labels, _ = cv2.connectedComponents(mask, connectivity=8)
+        num_components = num_labels - 1
         
-        total_pixels = np.sum(skeleton > 0)
+        # Count branch points (pixels with more than 2 neighbors) and end points
+        # in one pass; reflect-101 borders match the old filter2D handling
+        branch_points, end_points, total_pixels = _count_skeleton_points(mask)
         
         return {
             'num_components': num_components,
@@ -282,64 +441,118 @@ def calculate_connectivity_features(skeleton: np.ndarray) -> Dict[str, float]:
     except:
         return {'num_components': 0, 'branch_ratio': 0, 'end_ratio': 0}
 
+def match_sizes(img1: np.ndarray, img2: np.ndarray):
+    """Resize both images to their common (min height, min width)"""
+    h = min(img1.shape[0], img2.shape[0])
+    w = min(img1.shape[1], img2.shape[1])
+    if img1.shape[:2] != (h, w):
+        img1 = cv2.resize(img1, (w, h))
+    if img2.shape[:2] != (h, w):
+        img2 = cv2.resize(img2, (w, h))
+    return img1, img2
+
+SSIM_WIN = 7  # skimage's default uniform window
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+def downsample(img: np.ndarray, max_dim: int) -> np.ndarray:
+    """Shrink image so its longest side is at most max_dim (never upscales)"""
+    h, w = img.shape[:2]
+    scale = max_dim / max(h, w)
+    if scale >= 1:
+        return img
+    new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+    return cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+def _ssim_map(img1: np.ndarray, img2: np.ndarray) -> np.ndarray:
+    """Per-pixel SSIM of two same-sized images"""
+    # Same math as skimage's structural_similarity defaults (7x7 uniform window,
+    # sample covariance, uint8 data range) using OpenCV box filters
+    x = img1.astype(np.float64)
+    y = img2.astype(np.float64)
+    
+    def window_mean(a: np.ndarray) -> np.ndarray:
+        return cv2.blur(a, (SSIM_WIN, SSIM_WIN), borderType=cv2.BORDER_REFLECT)
+    
+    ux, uy = window_mean(x), window_mean(y)
+    cov_norm = SSIM_WIN ** 2 / (SSIM_WIN ** 2 - 1.0)
+    vx = cov_norm * (window_mean(x * x) - ux * ux)
+    vy = cov_norm * (window_mean(y * y) - uy * uy)
+    vxy = cov_norm * (window_mean(x * y) - ux * uy)
+    
+    return ((2 * ux * uy + SSIM_C1) * (2 * vxy + SSIM_C2)) / \
+           ((ux * ux + uy * uy + SSIM_C1) * (vx + vy + SSIM_C2))
+
 def calculate_ssim_score(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Calculate Structural Similarity Index"""
+    """Calculate Structural Similarity Index (inputs must be the same size)"""
     try:
-        # Ensure same size
-        h = min(img1.shape[0], img2.shape[0])
-        w = min(img1.shape[1], img2.shape[1])
-        img1_resized = cv2.resize(img1, (w, h))
-        img2_resized = cv2.resize(img2, (w, h))
-        
-        score, _ = ssim(img1_resized, img2_resized, full=True)
-        return float(score)
+        if min(img1.shape[:2]) < SSIM_WIN:
+            raise ValueError("Images are smaller than the SSIM window")
+        # Ignore the border where the window is reflected, as skimage does
+        pad = (SSIM_WIN - 1) // 2
+        return float(_ssim_map(img1, img2)[pad:-pad, pad:-pad].mean())
     except Exception as e:
         logger.error(f"SSIM error: {e}")
         return 0.5
 
+@njit(cache=True, nogil=True)
+def _correlation_sums(img1: np.ndarray, img2: np.ndarray):
+    """Exact integer sums of x, y, x^2, y^2 and xy over two same-sized images"""
+    sx = sy = sxx = syy = sxy = 0
+    for i in range(img1.shape[0]):
+        for j in range(img1.shape[1]):
+            x = np.int64(img1[i, j])
+            y = np.int64(img2[i, j])
+            sx += x
+            sy += y
+            sxx += x * x
+            syy += y * y
+            sxy += x * y
+    return sx, sy, sxx, syy, sxy
+
 def calculate_cross_correlation(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Calculate normalized cross-correlation"""
+    """Calculate normalized cross-correlation (inputs must be the same size)"""
     try:
-        # Ensure same size
-        h = min(img1.shape[0], img2.shape[0])
-        w = min(img1.shape[1], img2.shape[1])
-        img1_resized = cv2.resize(img1, (w, h)).astype(np.float64)
-        img2_resized = cv2.resize(img2, (w, h)).astype(np.float64)
-        
-        # Normalize
-        img1_norm = (img1_resized - np.mean(img1_resized)) / (np.std(img1_resized) + 1e-8)
-        img2_norm = (img2_resized - np.mean(img2_resized)) / (np.std(img2_resized) + 1e-8)
-        
-        # Calculate correlation
-        correlation = np.mean(img1_norm * img2_norm)
+        # All five reductions in a single pass over both images
+        n = img1.size
+        sx, sy, sxx, syy, sxy = _correlation_sums(img1, img2)
+        mean1, mean2 = sx / n, sy / n
+        std1 = math.sqrt(max(sxx / n - mean1 * mean1, 0.0))
+        std2 = math.sqrt(max(syy / n - mean2 * mean2, 0.0))
+        
+        # Calculate correlation as E[xy] - E[x]E[y] over the normalized stds,
+        # equivalent to averaging the product of the z-scored images
+        mean_product = sxy / n
+        correlation = (mean_product - mean1 * mean2) / ((std1 + 1e-8) * (std2 + 1e-8))
         return float(max(0, min(1, (correlation + 1) / 2)))  # Normalize to 0-1
     except:
         return 0.5
 
+# COLORMAP_JET as an RGB user colormap, so applyColorMap needs no BGR2RGB pass after it
+JET_RGB_LUT = np.ascontiguousarray(
+    cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), cv2.COLORMAP_JET)[:, :, ::-1]
+)
+
 def create_difference_heatmap(img1: np.ndarray, img2: np.ndarray) -> np.ndarray:
-    """Create a heatmap showing differences between two images"""
+    """Create a heatmap showing differences between two same-sized images"""
     try:
-        # Ensure same size
-        h = min(img1.shape[0], img2.shape[0])
-        w = min(img1.shape[1], img2.shape[1])
-        img1_resized = cv2.resize(img1, (w, h))
-        img2_resized = cv2.resize(img2, (w, h))
-        
-        # Calculate absolute difference
-        diff = cv2.absdiff(img1_resized, img2_resized)
+        # Calculate absolute difference at half resolution; the blurred map
+        # has no detail that needs the full grid
+        h, w = img1.shape[:2]
+        diff = cv2.absdiff(cv2.pyrDown(img1), cv2.pyrDown(img2))
         
-        # Apply Gaussian blur to smooth
-        diff_blurred = cv2.GaussianBlur(diff, (11, 11), 0)
+        # Apply Gaussian blur to smooth (7x7 at half scale ~ 11x11 at full)
+        diff_blurred = cv2.GaussianBlur(diff, (7, 7), 0)
         
         # Normalize to 0-255
         diff_norm = cv2.normalize(diff_blurred, None, 0, 255, cv2.NORM_MINMAX)
         
-        # Apply colormap (red = high difference)
-        heatmap = cv2.applyColorMap(diff_norm.astype(np.uint8), cv2.COLORMAP_JET)
-        heatmap = cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
+        # Apply colormap (red = high difference), then back to full size
+        heatmap = cv2.applyColorMap(diff_norm, JET_RGB_LUT)
+        heatmap = cv2.resize(heatmap, (w, h), interpolation=cv2.INTER_LINEAR)
         
-        # Overlay on original
-        img1_rgb = cv2.cvtColor(img1_resized, cv2.COLOR_GRAY2RGB) if len(img1_resized.shape) == 2 else img1_resized
+        # Overlay on original (kept at full resolution so the strokes stay sharp)
+        img1_rgb = cv2.cvtColor(img1, cv2.COLOR_GRAY2RGB) if len(img1.shape) == 2 else img1
         overlay = cv2.addWeighted(img1_rgb, 0.5, heatmap, 0.5, 0)
         
         return overlay
@@ -360,29 +573,42 @@ def compare_distributions(hist1: np.ndarray, hist2: np.ndarray) -> float:
     except:
         return 0.5
 
+# Compile the numba kernels at import rather than on the first request
+_curvature_accumulate(np.zeros((12, 2), dtype=np.int32), np.array([0, 12], dtype=np.int64))
+_count_skeleton_points(np.zeros((3, 3), dtype=np.uint8))
+_correlation_sums(np.zeros((3, 3), dtype=np.uint8), np.zeros((3, 3), dtype=np.uint8))
+
 # ============== AI ANALYSIS ==============
 
-async def perform_ai_analysis(img1_base64: str, img2_base64: str) -> Dict[str, Any]:
+# Leading base64 characters of the JPEG and PNG signatures
+BASE64_IMAGE_SIGNATURES = (('/9j/', 'image/jpeg'), ('iVBOR', 'image/png'))
+
+def image_data_url(base64_str: str) -> Optional[str]:
+    """Build a data URL for base64 JPEG/PNG data (bare or data URL); None for other formats"""
+    payload = base64_str.split(',', 1)[1] if base64_str.startswith('data:') else base64_str
+    for prefix, mime in BASE64_IMAGE_SIGNATURES:
+        if payload.startswith(prefix):
+            return f"data:{mime};base64,{payload}"
+    return None
+
+@lru_cache(maxsize=1)
+def get_xai_client(api_key: str):
+    """Return a shared xAI client (OpenAI compatible) so its HTTP pool is reused"""
+    from openai import OpenAI
+    return OpenAI(
+        api_key=api_key,
+        base_url="https://api.x.ai/v1"
+    )
+
+async def perform_ai_analysis(img1_url: str, img2_url: str) -> Dict[str, Any]:
     """Use Grok Vision to analyze handwriting samples"""
     try:
-        from openai import OpenAI
-        
         api_key = os.environ.get('XAI_API_KEY')
         if not api_key:
             logger.warning("No XAI_API_KEY found, skipping AI analysis")
             return {'score': 0.5, 'analysis': 'AI analysis unavailable - No Grok API key'}
         
-        # Initialize xAI client (OpenAI compatible)
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.x.ai/v1"
-        )
-        
-        # Clean base64 strings
-        if ',' in img1_base64:
-            img1_base64 = img1_base64.split(',')[1]
-        if ',' in img2_base64:
-            img2_base64 = img2_base64.split(',')[1]
+        client = get_xai_client(api_key)
         
         # Create message with images for Grok Vision
         messages = [
@@ -414,21 +640,22 @@ DETAILED_ANALYSIS: [comprehensive analysis paragraph]"""
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{img1_base64}"
+                            "url": img1_url
                         }
                     },
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/png;base64,{img2_base64}"
+                            "url": img2_url
                         }
                     }
                 ]
             }
         ]
         
-        # Call Grok Vision API
-        response = client.chat.completions.create(
+        # Call Grok Vision API (blocking client, keep it off the event loop)
+        response = await asyncio.to_thread(
+            client.chat.completions.create,
             model="grok-2-vision-1212",
             messages=messages,
             max_tokens=2000
@@ -459,61 +686,126 @@ DETAILED_ANALYSIS: [comprehensive analysis paragraph]"""
 
 # ============== MAIN COMPARISON ==============
 
-async def perform_comparison(questioned_img: np.ndarray, known_img: np.ndarray, use_ai: bool = True) -> Dict[str, Any]:
+COMPARE_MAX_DIM = 200  # longest side used for SSIM / cross-correlation
+
+async def run_cpu(func, *args):
+    """Run CPU-bound image work on the shared OpenCV pool"""
+    return await asyncio.get_running_loop().run_in_executor(CV_EXECUTOR, partial(func, *args))
+
+async def run_pdf(func, *args):
+    """Run a PDF builder off the event loop on the report pool"""
+    return await asyncio.get_running_loop().run_in_executor(PDF_EXECUTOR, partial(func, *args))
+
+def analyze_sample(img: np.ndarray) -> Dict[str, Any]:
+    """Preprocess one (RGB) sample and extract its per-image features"""
+    processed = _preprocess_from_gray(cv2.cvtColor(img, cv2.COLOR_RGB2GRAY))
+    return {
+        # perform_comparison only needs the normalized image; the binaries and
+        # skeleton are released once the features are extracted
+        'normalized': processed['normalized'],
+        # Size thresholds scaled for the half-resolution binary
+        'slant': calculate_slant_angle(processed['binary_small'], min_area=12),
+        'ratio': calculate_letter_ratio(processed['binary_small'], min_width=2, min_height=5),
+        'spacing': calculate_line_spacing(processed['binary']),
+        'stroke_hist': calculate_stroke_width_distribution(processed['skeleton'], processed['normalized'],
+                                                           processed['skeleton_mask']),
+        'curvature': calculate_curvature_stats(processed['skeleton']),
+        'connectivity': calculate_connectivity_features(processed['skeleton'], processed['skeleton_mask']),
+    }
+
+async def run_ai_analysis(questioned_img: np.ndarray, known_img: np.ndarray,
+                          questioned_base64: Optional[str] = None,
+                          known_base64: Optional[str] = None) -> Dict[str, Any]:
+    """Run the AI analysis, sending the original uploads when they are JPEG/PNG"""
+    async def to_data_url(img: np.ndarray, original: Optional[str]) -> str:
+        url = image_data_url(original) if original is not None else None
+        if url is None:
+            # Unknown or missing upload format: re-encode as PNG off the event loop
+            url = image_data_url(await run_cpu(image_to_base64, img))
+        return url
+    
+    questioned_url, known_url = await asyncio.gather(
+        to_data_url(questioned_img, questioned_base64),
+        to_data_url(known_img, known_base64)
+    )
+    return await perform_ai_analysis(questioned_url, known_url)
+
+async def perform_comparison(questioned_img: np.ndarray, known_img: np.ndarray, use_ai: bool = True,
+                             questioned_base64: Optional[str] = None,
+                             known_base64: Optional[str] = None) -> Dict[str, Any]:
     """Perform complete handwriting comparison"""
     
-    # Preprocess both images
-    q_processed = preprocess_image(questioned_img)
-    k_processed = preprocess_image(known_img)
+    # Start the AI round-trip first so it overlaps with local processing
+    ai_task = asyncio.create_task(
+        run_ai_analysis(questioned_img, known_img, questioned_base64, known_base64)
+    ) if use_ai else None
+    
+    try:
+        # Preprocess and extract features for both images concurrently
+        q, k = await asyncio.gather(
+            run_cpu(analyze_sample, questioned_img),
+            run_cpu(analyze_sample, known_img)
+        )
+        # Size-match once, then run the independent image-based comparisons.
+        # SSIM/correlation only need overall shape, so they run on a small copy;
+        # the heatmap is displayed and stays at full resolution. Area averaging
+        # turns stroke edges grey: correlation reads higher than at full size,
+        # SSIM lower on clean, well-aligned pairs and higher on speckled ones.
+        q_matched, k_matched = match_sizes(q['normalized'], k['normalized'])
+        q_small = downsample(q_matched, COMPARE_MAX_DIM)
+        k_small = downsample(k_matched, COMPARE_MAX_DIM)
+        ssim_score, correlation_score, heatmap = await asyncio.gather(
+            run_cpu(calculate_ssim_score, q_small, k_small),
+            run_cpu(calculate_cross_correlation, q_small, k_small),
+            run_cpu(create_difference_heatmap, q_matched, k_matched)
+        )
+        
+        # Encode the returned images off the event loop, while the AI request
+        # may still be in flight
+        processed_q_b64, processed_k_b64, heatmap_b64 = await asyncio.gather(
+            run_cpu(image_to_base64, q['normalized']),
+            run_cpu(image_to_base64, k['normalized']),
+            run_cpu(image_to_base64, heatmap)
+        )
+    except BaseException:
+        if ai_task:
+            ai_task.cancel()
+        raise
     
     # 1. MACRO FEATURES
-    q_slant = calculate_slant_angle(q_processed['binary'])
-    k_slant = calculate_slant_angle(k_processed['binary'])
+    q_slant, k_slant = q['slant'], k['slant']
     slant_diff = abs(q_slant - k_slant)
     slant_score = max(0, 1 - slant_diff / 30)  # 30 degree max difference
     
-    q_ratio = calculate_letter_ratio(q_processed['binary'])
-    k_ratio = calculate_letter_ratio(k_processed['binary'])
+    q_ratio, k_ratio = q['ratio'], k['ratio']
     ratio_diff = abs(q_ratio - k_ratio)
     ratio_score = max(0, 1 - ratio_diff / 0.5)
     
-    q_spacing = calculate_line_spacing(q_processed['binary'])
-    k_spacing = calculate_line_spacing(k_processed['binary'])
-    spacing_diff = abs(q_spacing - k_spacing)
+    spacing_diff = abs(q['spacing'] - k['spacing'])
     spacing_score = max(0, 1 - spacing_diff / 0.2)
     
     macro_score = (slant_score + ratio_score + spacing_score) / 3
     
     # 2. STROKE/MICRO FEATURES
-    q_stroke_hist = calculate_stroke_width_distribution(q_processed['skeleton'], q_processed['normalized'])
-    k_stroke_hist = calculate_stroke_width_distribution(k_processed['skeleton'], k_processed['normalized'])
-    stroke_score = compare_distributions(q_stroke_hist, k_stroke_hist)
+    stroke_score = compare_distributions(q['stroke_hist'], k['stroke_hist'])
     
-    q_curvature = calculate_curvature_stats(q_processed['skeleton'])
-    k_curvature = calculate_curvature_stats(k_processed['skeleton'])
+    q_curvature, k_curvature = q['curvature'], k['curvature']
     curvature_diff = abs(q_curvature['mean'] - k_curvature['mean'])
     curvature_score = max(0, 1 - curvature_diff / 0.5)
     
-    q_connectivity = calculate_connectivity_features(q_processed['skeleton'])
-    k_connectivity = calculate_connectivity_features(k_processed['skeleton'])
-    branch_diff = abs(q_connectivity['branch_ratio'] - k_connectivity['branch_ratio'])
+    branch_diff = abs(q['connectivity']['branch_ratio'] - k['connectivity']['branch_ratio'])
     connectivity_score = max(0, 1 - branch_diff * 50)
     
     micro_score = (stroke_score + curvature_score + connectivity_score) / 3
     
     # 3. IMAGE-BASED SIMILARITY
-    ssim_score = calculate_ssim_score(q_processed['normalized'], k_processed['normalized'])
-    correlation_score = calculate_cross_correlation(q_processed['normalized'], k_processed['normalized'])
-    
     image_score = (ssim_score + correlation_score) / 2
     
     # 4. AI ANALYSIS (optional)
     ai_score = 0.5
     ai_analysis = None
-    if use_ai:
-        q_base64 = image_to_base64(questioned_img)
-        k_base64 = image_to_base64(known_img)
-        ai_result = await perform_ai_analysis(q_base64, k_base64)
+    if ai_task:
+        ai_result = await ai_task
         ai_score = ai_result['score']
         ai_analysis = ai_result['analysis']
     
@@ -537,9 +829,6 @@ async def perform_comparison(questioned_img: np.ndarray, known_img: np.ndarray,
         ai_score * weights['ai']
     )
     
-    # Create heatmap
-    heatmap = create_difference_heatmap(q_processed['normalized'], k_processed['normalized'])
-    
     # Calculate match probability
     # The composite score represents similarity - we use it directly as match probability
     match_probability = composite * 100
@@ -578,11 +867,9 @@ async def perform_comparison(questioned_img: np.ndarray, known_img: np.ndarray,
         'sub_scores': sub_scores,
         'verdict': verdict,
         'verdict_color': verdict_color,
-        'processed_questioned': image_to_base64(q_processed['normalized']),
-        'processed_known': image_to_base64(k_processed['normalized']),
-        'skeleton_questioned': image_to_base64(q_processed['skeleton']),
-        'skeleton_known': image_to_base64(k_processed['skeleton']),
-        'heatmap': image_to_base64(heatmap),
+        'processed_questioned': processed_q_b64,
+        'processed_known': processed_k_b64,
+        'heatmap': heatmap_b64,
         'ai_analysis': ai_analysis
     }
 
@@ -602,18 +889,23 @@ async def compare_handwriting(request: ComparisonRequest):
     try:
         logger.info("Starting handwriting comparison...")
         
-        # Decode images
-        questioned_img = base64_to_image(request.questioned_image)
-        known_img = base64_to_image(request.known_image)
+        # Decode images (off the event loop)
+        questioned_img, known_img = await asyncio.gather(
+            run_cpu(base64_to_image, request.questioned_image),
+            run_cpu(base64_to_image, request.known_image)
+        )
         
         logger.info(f"Images loaded: Q={questioned_img.shape}, K={known_img.shape}")
         
-        # Perform comparison
-        result = await perform_comparison(questioned_img, known_img, request.use_ai_analysis)
+        # Perform comparison; the uploads are already base64, so reuse them for the AI
+        result = await perform_comparison(questioned_img, known_img, request.use_ai_analysis,
+                                          request.questioned_image, request.known_image)
         
         # Create thumbnails
-        q_thumb = create_thumbnail(questioned_img)
-        k_thumb = create_thumbnail(known_img)
+        q_thumb, k_thumb = await asyncio.gather(
+            run_cpu(create_thumbnail, questioned_img),
+            run_cpu(create_thumbnail, known_img)
+        )
         
         # Build response
         comparison_result = ComparisonResult(
@@ -636,12 +928,20 @@ async def compare_handwriting(request: ComparisonRequest):
             'composite_score': comparison_result.composite_score,
             'verdict': comparison_result.verdict,
             'verdict_color': comparison_result.verdict_color,
-            'questioned_thumb': q_thumb,
-            'known_thumb': k_thumb,
             'sub_scores': [s.dict() for s in comparison_result.sub_scores],
             'ai_analysis': comparison_result.ai_analysis
         }
-        await db.comparisons.insert_one(history_doc)
+        # Thumbnails go to their own collection as raw JPEG bytes so the
+        # comparisons documents stay small
+        thumbs_doc = {
+            '_id': comparison_result.id,
+            'q': pybase64.b64decode(q_thumb),
+            'k': pybase64.b64decode(k_thumb)
+        }
+        await asyncio.gather(
+            db.comparisons.insert_one(history_doc),
+            db.thumbs.insert_one(thumbs_doc)
+        )
         
         logger.info(f"Comparison complete: {comparison_result.composite_score}%")
         return comparison_result
@@ -652,24 +952,28 @@ async def compare_handwriting(request: ComparisonRequest):
         logger.error(f"Comparison error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def attach_thumbs(docs: List[Dict[str, Any]]) -> None:
+    """Fill in questioned_thumb/known_thumb (base64) from the thumbs collection"""
+    ids = [d['id'] for d in docs if 'questioned_thumb' not in d]  # older docs hold them inline
+    if not ids:
+        return
+    cursor = db.thumbs.find({'_id': {'$in': ids}})
+    thumbs = {t['_id']: t for t in await cursor.to_list(length=len(ids))}
+    for d in docs:
+        if 'questioned_thumb' in d:
+            continue
+        t = thumbs.get(d['id'], {})
+        d['questioned_thumb'] = pybase64.b64encode(t.get('q', b'')).decode()
+        d['known_thumb'] = pybase64.b64encode(t.get('k', b'')).decode()
+
 @api_router.get("/history", response_model=List[ComparisonHistory])
 async def get_history(limit: int = 20):
     """Get comparison history"""
     try:
-        cursor = db.comparisons.find().sort('timestamp', -1).limit(limit)
+        cursor = db.comparisons.find({}, HISTORY_PROJECTION).sort('timestamp', -1).limit(limit)
         history = await cursor.to_list(length=limit)
-        return [
-            ComparisonHistory(
-                id=h['id'],
-                timestamp=h['timestamp'],
-                composite_score=h['composite_score'],
-                verdict=h['verdict'],
-                verdict_color=h['verdict_color'],
-                questioned_thumb=h['questioned_thumb'],
-                known_thumb=h['known_thumb']
-            )
-            for h in history
-        ]
+        await attach_thumbs(history)
+        return HISTORY_ADAPTER.validate_python(history)
     except Exception as e:
         logger.error(f"History error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -682,6 +986,7 @@ async def get_comparison(comparison_id: str):
         if not comparison:
             raise HTTPException(status_code=404, detail="Comparison not found")
         comparison['_id'] = str(comparison['_id'])
+        await attach_thumbs([comparison])
         return comparison
     except HTTPException:
         raise
@@ -689,11 +994,29 @@ async def get_comparison(comparison_id: str):
         logger.error(f"Get comparison error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/thumb/{comparison_id}/{side}")
+async def get_thumb(comparison_id: str, side: str):
+    """Serve a stored thumbnail (side is 'questioned' or 'known') as JPEG"""
+    try:
+        if side not in ('questioned', 'known'):
+            raise HTTPException(status_code=404, detail="Unknown thumbnail side")
+        field = side[0]
+        thumbs = await db.thumbs.find_one({'_id': comparison_id}, {field: 1})
+        if not thumbs:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        return Response(content=thumbs[field], media_type="image/jpeg")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get thumbnail error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.delete("/history/{comparison_id}")
 async def delete_comparison(comparison_id: str):
     """Delete a comparison from history"""
     try:
         result = await db.comparisons.delete_one({'id': comparison_id})
+        await db.thumbs.delete_one({'_id': comparison_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Comparison not found")
         return {"message": "Comparison deleted successfully"}
@@ -708,6 +1031,7 @@ async def clear_history():
     """Clear all comparison history"""
     try:
         result = await db.comparisons.delete_many({})
+        await db.thumbs.delete_many({})
         return {"message": f"Deleted {result.deleted_count} comparisons"}
     except Exception as e:
         logger.error(f"Clear history error: {e}")
@@ -730,12 +1054,18 @@ class LocalComparisonRequest(BaseModel):
     overlay_width: int
     overlay_height: int
 
+def local_region(request: LocalComparisonRequest, base_w: int, base_h: int) -> Tuple[int, int, int, int]:
+    """(x, y, width, height) of the requested overlay region, clipped to the base image"""
+    x = max(0, min(request.overlay_x, base_w - 1))
+    y = max(0, min(request.overlay_y, base_h - 1))
+    return x, y, min(request.overlay_width, base_w - x), min(request.overlay_height, base_h - y)
+
 @api_router.post("/crop-region")
 async def crop_region(request: CropRequest):
     """Crop a region from an image and return it with transparent background"""
     try:
         # Decode image
-        img = base64_to_image(request.image_base64)
+        img = await run_cpu(base64_to_image, request.image_base64)
         
         # Validate crop bounds
         h, w = img.shape[:2]
@@ -760,14 +1090,11 @@ async def crop_region(request: CropRequest):
         # Apply alpha mask
         cropped_rgba[:, :, 3] = alpha_mask
         
-        # Also create a version with solid background for fallback
-        cropped_solid = image_to_base64(cropped, 'PNG')
-        
-        # Convert RGBA to base64
-        pil_img = Image.fromarray(cropped_rgba)
-        buffer = io.BytesIO()
-        pil_img.save(buffer, format='PNG')
-        cropped_transparent = base64.b64encode(buffer.getvalue()).decode()
+        # Encode the transparent version and a solid-background fallback (off the event loop)
+        cropped_transparent, cropped_solid = await asyncio.gather(
+            run_cpu(image_to_base64, cropped_rgba, 'PNG'),
+            run_cpu(image_to_base64, cropped, 'PNG')
+        )
         
         logger.info(f"Cropped region: {crop_w}x{crop_h} from position ({x}, {y})")
         
@@ -784,84 +1111,158 @@ async def crop_region(request: CropRequest):
         logger.error(f"Crop error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+SSIM_BAND_ROWS = 128  # rows per band in the parallel SSIM
+
+def _ssim_band_sum(img1: np.ndarray, img2: np.ndarray, start: int, stop: int) -> float:
+    """Sum of the SSIM map over rows [start, stop) of the unreflected interior"""
+    # A halo of pad rows gives every row in the band the same 7x7 window it has
+    # in the whole-image map, so the bands add up to the global score
+    pad = (SSIM_WIN - 1) // 2
+    lo, hi = start - pad, stop + pad
+    s_map = _ssim_map(img1[lo:hi], img2[lo:hi])
+    return float(s_map[pad:-pad, pad:-pad].sum())
+
+async def calculate_ssim_score_banded(img1: np.ndarray, img2: np.ndarray) -> float:
+    """calculate_ssim_score for large regions, as row bands run concurrently on CV_EXECUTOR"""
+    h, w = img1.shape[:2]
+    if h < 2 * SSIM_BAND_ROWS or w < SSIM_WIN:
+        return await run_cpu(calculate_ssim_score, img1, img2)
+    try:
+        pad = (SSIM_WIN - 1) // 2
+        starts = range(pad, h - pad, SSIM_BAND_ROWS)
+        sums = await asyncio.gather(*(
+            run_cpu(_ssim_band_sum, img1, img2, start, min(start + SSIM_BAND_ROWS, h - pad))
+            for start in starts
+        ))
+        return sum(sums) / ((h - 2 * pad) * (w - 2 * pad))
+    except Exception as e:
+        logger.error(f"SSIM error: {e}")
+        return 0.5
+
+def create_local_heatmap(img1: np.ndarray, img2: np.ndarray) -> np.ndarray:
+    """Difference heatmap (RGB) between two same-sized grayscale regions"""
+    diff = cv2.absdiff(img1, img2)
+    diff_blurred = cv2.GaussianBlur(diff, (5, 5), 0)
+    diff_norm = cv2.normalize(diff_blurred, None, 0, 255, cv2.NORM_MINMAX)
+    return cv2.applyColorMap(diff_norm, JET_RGB_LUT)
+
 @api_router.post("/local-comparison")
 async def local_comparison(request: LocalComparisonRequest):
     """Compare overlay region with the corresponding area in base image"""
     try:
-        # Decode images
-        base_img = base64_to_image(request.base_image)
-        overlay_img = base64_to_image(request.overlay_image)
+        # Base64-decode both uploads (off the event loop)
+        base_bytes, overlay_bytes = await asyncio.gather(
+            run_cpu(base64_to_bytes, request.base_image),
+            run_cpu(base64_to_bytes, request.overlay_image)
+        )
+        
+        # Degenerate drags are answered from the file headers alone, so they
+        # skip the pixel decode; unreadable headers are still rejected (400)
+        base_header_w, base_header_h = image_header_size(base_bytes)
+        image_header_size(overlay_bytes)
+        _, _, target_w, target_h = local_region(request, base_header_w, base_header_h)
+        if target_w < 10 or target_h < 10:
+            return {"local_ssim": 0, "difference_heatmap": "", "edge_overlap": 0}
+        
+        base_img, overlay_img = await asyncio.gather(
+            run_cpu(decode_image_bytes, base_bytes),
+            run_cpu(decode_image_bytes, overlay_bytes)
+        )
         
         # Get dimensions
         base_h, base_w = base_img.shape[:2]
         overlay_h, overlay_w = overlay_img.shape[:2]
         
         # Calculate the region in base image that corresponds to overlay position
-        x = max(0, min(request.overlay_x, base_w - 1))
-        y = max(0, min(request.overlay_y, base_h - 1))
-        
-        # Resize overlay to match requested dimensions
-        target_w = min(request.overlay_width, base_w - x)
-        target_h = min(request.overlay_height, base_h - y)
-        
+        # (from the decoded size, in case a header disagrees with the decoder)
+        x, y, target_w, target_h = local_region(request, base_w, base_h)
         if target_w < 10 or target_h < 10:
             return {"local_ssim": 0, "difference_heatmap": "", "edge_overlap": 0}
         
-        # Resize overlay
-        overlay_resized = cv2.resize(overlay_img, (target_w, target_h))
+        # Convert to grayscale first so the resize moves a third of the bytes;
+        # everything downstream only needs single-channel data
+        overlay_img = cv2.cvtColor(overlay_img, cv2.COLOR_RGB2GRAY)
         
-        # Extract corresponding region from base
+        # Extract corresponding region from base (only the region is converted)
         base_region = base_img[y:y+target_h, x:x+target_w]
-        
-        # Convert to grayscale for comparison
-        if len(overlay_resized.shape) == 3:
-            overlay_gray = cv2.cvtColor(overlay_resized, cv2.COLOR_RGB2GRAY)
-        else:
-            overlay_gray = overlay_resized
-            
-        if len(base_region.shape) == 3:
-            base_gray = cv2.cvtColor(base_region, cv2.COLOR_RGB2GRAY)
-        else:
-            base_gray = base_region
-        
-        # Calculate local SSIM
-        local_ssim_score = calculate_ssim_score(overlay_gray, base_gray)
-        
-        # Create difference heatmap
-        diff = cv2.absdiff(overlay_gray, base_gray)
-        diff_blurred = cv2.GaussianBlur(diff, (5, 5), 0)
-        diff_norm = cv2.normalize(diff_blurred, None, 0, 255, cv2.NORM_MINMAX)
-        heatmap = cv2.applyColorMap(diff_norm.astype(np.uint8), cv2.COLORMAP_JET)
-        heatmap_rgb = cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB)
+        base_gray = cv2.cvtColor(base_region, cv2.COLOR_RGB2GRAY)
+        
+        # Resize overlay: box-average when shrinking on both axes (alias-free
+        # for thin strokes), bilinear otherwise
+        interp = cv2.INTER_AREA if target_w < overlay_w and target_h < overlay_h else cv2.INTER_LINEAR
+        overlay_gray = cv2.resize(overlay_img, (target_w, target_h), interpolation=interp)
+        
+        # Local SSIM, the difference heatmap and both edge maps are
+        # independent, so they run concurrently on the CV pool
+        local_ssim_score, heatmap_rgb, overlay_edges, base_edges = await asyncio.gather(
+            calculate_ssim_score_banded(overlay_gray, base_gray),
+            run_cpu(create_local_heatmap, overlay_gray, base_gray),
+            run_cpu(cv2.Canny, overlay_gray, 50, 150),
+            run_cpu(cv2.Canny, base_gray, 50, 150)
+        )
         
         # Calculate edge overlap
-        overlay_edges = cv2.Canny(overlay_gray, 50, 150)
-        base_edges = cv2.Canny(base_gray, 50, 150)
-        edge_intersection = np.logical_and(overlay_edges > 0, base_edges > 0)
-        edge_union = np.logical_or(overlay_edges > 0, base_edges > 0)
-        edge_overlap = np.sum(edge_intersection) / (np.sum(edge_union) + 1e-8)
-        
-        # Create edge overlay visualization
-        edge_viz = np.zeros((target_h, target_w, 3), dtype=np.uint8)
-        edge_viz[overlay_edges > 0] = [255, 0, 0]  # Red for overlay edges
-        edge_viz[base_edges > 0] = [0, 255, 0]  # Green for base edges
-        edge_viz[edge_intersection] = [255, 255, 0]  # Yellow for matching
+        # Pack the {0, 255} edge maps to 1 bit per pixel and popcount the
+        # intersection / union bitmaps
+        overlay_bits = np.packbits(overlay_edges)
+        base_bits = np.packbits(base_edges)
+        edge_intersection = int(np.bitwise_count(overlay_bits & base_bits).sum())
+        edge_union = int(np.bitwise_count(overlay_bits | base_bits).sum())
+        edge_overlap = edge_intersection / (edge_union + 1e-8)
+        
+        # Create edge overlay visualization in one interleaving pass: the 0/255
+        # Canny maps are exactly the red and green planes, giving red for
+        # overlay edges, green for base edges and yellow for matching
+        edge_viz = cv2.merge([overlay_edges, base_edges, np.zeros_like(base_edges)])
         
         logger.info(f"Local comparison: SSIM={local_ssim_score:.3f}, Edge overlap={edge_overlap:.3f}")
         
+        # Smooth colour field: JPEG is ~20x faster to encode and ~6x smaller
+        # than PNG here; the 1px edge lines stay lossless PNG
+        heatmap_b64, edge_viz_b64 = await asyncio.gather(
+            run_cpu(image_to_base64, heatmap_rgb, 'JPEG'),
+            run_cpu(image_to_base64, edge_viz, 'PNG')
+        )
+        
         return {
             "local_ssim": round(local_ssim_score * 100, 1),
-            "difference_heatmap": image_to_base64(heatmap_rgb, 'PNG'),
+            "difference_heatmap": heatmap_b64,
             "edge_overlap": round(edge_overlap * 100, 1),
-            "edge_visualization": image_to_base64(edge_viz, 'PNG'),
+            "edge_visualization": edge_viz_b64,
             "region_width": target_w,
             "region_height": target_h
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Local comparison error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ReportLab styles are built once and shared by every PDF request
+PDF_STYLES = getSampleStyleSheet()
+PDF_NORMAL_STYLE = ParagraphStyle('Normal', parent=PDF_STYLES['Normal'], fontSize=10, spaceAfter=6)
+OVERLAY_TITLE_STYLE = ParagraphStyle('Title', parent=PDF_STYLES['Heading1'], fontSize=20, alignment=TA_CENTER, spaceAfter=15)
+OVERLAY_HEADING_STYLE = ParagraphStyle('Heading', parent=PDF_STYLES['Heading2'], fontSize=12, spaceAfter=8, spaceBefore=12)
+OVERLAY_SETTINGS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#1e293b')),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+    ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f8fafc')),
+])
+OVERLAY_SCORES_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
+])
+
 class OverlayReportRequest(BaseModel):
     base_image: str
     overlay_image: str
@@ -874,102 +1275,133 @@ class OverlayReportRequest(BaseModel):
     edge_overlap: float
     notes: Optional[str] = None
 
+def build_overlay_pdf(request: OverlayReportRequest) -> bytes:
+    """Render the overlay comparison report to PDF bytes"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm)
+    
+    elements = []
+    
+    # Title
+    elements.append(Paragraph("Detail Overlay Comparison Report", OVERLAY_TITLE_STYLE))
+    elements.append(Paragraph(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}", PDF_NORMAL_STYLE))
+    elements.append(Spacer(1, 15))
+    
+    # Overlay Settings
+    elements.append(Paragraph("OVERLAY SETTINGS", OVERLAY_HEADING_STYLE))
+    settings_data = [
+        ["Position (X, Y)", f"({request.overlay_x}, {request.overlay_y})"],
+        ["Size (W × H)", f"{request.overlay_width} × {request.overlay_height} px"],
+        ["Transparency", f"{int(request.overlay_alpha * 100)}%"],
+    ]
+    settings_table = Table(settings_data, colWidths=[2*inch, 3*inch])
+    settings_table.setStyle(OVERLAY_SETTINGS_TABLE_STYLE)
+    elements.append(settings_table)
+    elements.append(Spacer(1, 15))
+    
+    # Local Comparison Scores
+    elements.append(Paragraph("LOCAL COMPARISON METRICS", OVERLAY_HEADING_STYLE))
+    
+    ssim_color = colors.HexColor('#22c55e') if request.local_ssim >= 85 else (
+        colors.HexColor('#f59e0b') if request.local_ssim >= 70 else colors.HexColor('#ef4444')
+    )
+    edge_color = colors.HexColor('#22c55e') if request.edge_overlap >= 50 else (
+        colors.HexColor('#f59e0b') if request.edge_overlap >= 30 else colors.HexColor('#ef4444')
+    )
+    
+    scores_data = [
+        ["Metric", "Score", "Interpretation"],
+        ["Local SSIM", f"{request.local_ssim:.1f}%", "Structural similarity in overlay region"],
+        ["Edge Overlap", f"{request.edge_overlap:.1f}%", "Stroke edge alignment match"],
+    ]
+    scores_table = Table(scores_data, colWidths=[1.5*inch, 1*inch, 3*inch])
+    scores_table.setStyle(OVERLAY_SCORES_TABLE_STYLE)
+    elements.append(scores_table)
+    elements.append(Spacer(1, 15))
+    
+    # Notes
+    if request.notes:
+        elements.append(Paragraph("EXAMINER NOTES", OVERLAY_HEADING_STYLE))
+        elements.append(Paragraph(request.notes, PDF_NORMAL_STYLE))
+    
+    # Build PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+def overlay_pdf_filename() -> str:
+    return f"overlay_comparison_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
+
 @api_router.post("/generate-overlay-pdf")
 async def generate_overlay_pdf(request: OverlayReportRequest):
     """Generate PDF report for overlay comparison"""
     try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import inch, mm
-        from reportlab.lib import colors
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm)
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=20, alignment=TA_CENTER, spaceAfter=15)
-        heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=12, spaceAfter=8, spaceBefore=12)
-        normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10, spaceAfter=6)
-        
-        elements = []
-        
-        # Title
-        elements.append(Paragraph("Detail Overlay Comparison Report", title_style))
-        elements.append(Paragraph(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}", normal_style))
-        elements.append(Spacer(1, 15))
-        
-        # Overlay Settings
-        elements.append(Paragraph("OVERLAY SETTINGS", heading_style))
-        settings_data = [
-            ["Position (X, Y)", f"({request.overlay_x}, {request.overlay_y})"],
-            ["Size (W × H)", f"{request.overlay_width} × {request.overlay_height} px"],
-            ["Transparency", f"{int(request.overlay_alpha * 100)}%"],
-        ]
-        settings_table = Table(settings_data, colWidths=[2*inch, 3*inch])
-        settings_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#1e293b')),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ('BACKGROUND', (1, 0), (1, -1), colors.HexColor('#f8fafc')),
-        ]))
-        elements.append(settings_table)
-        elements.append(Spacer(1, 15))
-        
-        # Local Comparison Scores
-        elements.append(Paragraph("LOCAL COMPARISON METRICS", heading_style))
-        
-        ssim_color = colors.HexColor('#22c55e') if request.local_ssim >= 85 else (
-            colors.HexColor('#f59e0b') if request.local_ssim >= 70 else colors.HexColor('#ef4444')
-        )
-        edge_color = colors.HexColor('#22c55e') if request.edge_overlap >= 50 else (
-            colors.HexColor('#f59e0b') if request.edge_overlap >= 30 else colors.HexColor('#ef4444')
-        )
-        
-        scores_data = [
-            ["Metric", "Score", "Interpretation"],
-            ["Local SSIM", f"{request.local_ssim:.1f}%", "Structural similarity in overlay region"],
-            ["Edge Overlap", f"{request.edge_overlap:.1f}%", "Stroke edge alignment match"],
-        ]
-        scores_table = Table(scores_data, colWidths=[1.5*inch, 1*inch, 3*inch])
-        scores_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
-        ]))
-        elements.append(scores_table)
-        elements.append(Spacer(1, 15))
-        
-        # Notes
-        if request.notes:
-            elements.append(Paragraph("EXAMINER NOTES", heading_style))
-            elements.append(Paragraph(request.notes, normal_style))
-        
-        # Build PDF
-        doc.build(elements)
-        
-        pdf_bytes = buffer.getvalue()
-        pdf_base64 = base64.b64encode(pdf_bytes).decode()
+        pdf_bytes = await run_pdf(build_overlay_pdf, request)
+        pdf_base64 = (await run_cpu(pybase64.b64encode, pdf_bytes)).decode()
         
         return {
             "pdf_base64": pdf_base64,
-            "filename": f"overlay_comparison_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
+            "filename": overlay_pdf_filename()
         }
         
     except Exception as e:
         logger.error(f"Overlay PDF error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/generate-overlay-pdf/stream")
+async def stream_overlay_pdf(request: OverlayReportRequest):
+    """Same report as /generate-overlay-pdf, returned as the raw PDF (no base64)"""
+    try:
+        pdf_bytes = await run_pdf(build_overlay_pdf, request)
+        return Response(content=pdf_bytes, media_type="application/pdf",
+                        headers={"Content-Disposition": f'attachment; filename="{overlay_pdf_filename()}"'})
+        
+    except Exception as e:
+        logger.error(f"Overlay PDF error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============== PDF REPORT GENERATION ==============
 
+REPORT_TITLE_STYLE = ParagraphStyle('Title', parent=PDF_STYLES['Heading1'], fontSize=24, alignment=TA_CENTER, spaceAfter=20)
+REPORT_HEADING_STYLE = ParagraphStyle('Heading', parent=PDF_STYLES['Heading2'], fontSize=14, spaceAfter=10, spaceBefore=15)
+SCORE_STYLE = ParagraphStyle('Score', parent=PDF_STYLES['Normal'], fontSize=36, alignment=TA_CENTER, textColor=colors.HexColor('#3b82f6'))
+VERDICT_STYLE = ParagraphStyle('Verdict', parent=PDF_STYLES['Normal'], fontSize=16, alignment=TA_CENTER, spaceAfter=20)
+AI_TEXT_MARKUP = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\n': '<br/>'})
+REPORT_IMAGES_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+])
+REPORT_SCORES_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+    ('TOPPADDING', (0, 0), (-1, 0), 10),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8fafc')),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
+])
+
+@lru_cache(maxsize=128)
+def decode_report_image(b64_str: str) -> bytes:
+    """Decode a (data URI or bare) base64 image; repeat exports of a report reuse it"""
+    if ',' in b64_str:
+        b64_str = b64_str.split(',', 1)[1]
+    return pybase64.b64decode(b64_str)
+
+def base64_to_rl_image(b64_str: str, width: float, height: float) -> RLImage:
+    return RLImage(io.BytesIO(decode_report_image(b64_str)), width=width, height=height)
+
+class ReportSubScore(SubScore):
+    # Report payloads come from the client; a partial row renders blank
+    name: str = ''
+    score: float = 0.0
+    description: str = ''
+
 class PDFReportRequest(BaseModel):
     comparison_id: str
     questioned_thumb: str
@@ -978,138 +1410,98 @@ class PDFReportRequest(BaseModel):
     processed_known: str
     difference_heatmap: str
     composite_score: float
-    sub_scores: List[Dict[str, Any]]
+    sub_scores: List[ReportSubScore]
     verdict: str
     ai_analysis: Optional[str] = None
 
-from fastapi.responses import Response
+def build_report_pdf(request: PDFReportRequest) -> bytes:
+    """Render the forensic comparison report to PDF bytes"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm)
+    
+    elements = []
+    
+    # Title
+    elements.append(Paragraph("Handwriting Forensic Analysis Report", REPORT_TITLE_STYLE))
+    elements.append(Spacer(1, 10))
+    
+    # Timestamp and ID
+    elements.append(Paragraph(f"Report ID: {request.comparison_id}", PDF_NORMAL_STYLE))
+    elements.append(Paragraph(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}", PDF_NORMAL_STYLE))
+    elements.append(Paragraph("App Version: 1.0.0", PDF_NORMAL_STYLE))
+    elements.append(Spacer(1, 20))
+    
+    # Composite Score
+    elements.append(Paragraph("COMPOSITE FORENSIC SCORE", REPORT_HEADING_STYLE))
+    
+    # Determine verdict color
+    if request.composite_score >= 88:
+        verdict_color = colors.HexColor('#22c55e')
+    elif request.composite_score >= 70:
+        verdict_color = colors.HexColor('#f59e0b')
+    else:
+        verdict_color = colors.HexColor('#ef4444')
+    
+    score_style_colored = ParagraphStyle('ScoreColored', parent=SCORE_STYLE, textColor=verdict_color)
+    elements.append(Paragraph(f"{request.composite_score:.1f}%", score_style_colored))
+    
+    verdict_style_colored = ParagraphStyle('VerdictColored', parent=VERDICT_STYLE, textColor=verdict_color)
+    elements.append(Paragraph(request.verdict, verdict_style_colored))
+    elements.append(Spacer(1, 10))
+    
+    # Sample Images
+    elements.append(Paragraph("SAMPLE IMAGES", REPORT_HEADING_STYLE))
+    
+    try:
+        q_img = base64_to_rl_image(request.questioned_thumb, 2*inch, 2*inch)
+        k_img = base64_to_rl_image(request.known_thumb, 2*inch, 2*inch)
+        
+        img_table = Table([
+            [Paragraph("Questioned Document", PDF_NORMAL_STYLE), Paragraph("Known Sample", PDF_NORMAL_STYLE)],
+            [q_img, k_img]
+        ], colWidths=[3*inch, 3*inch])
+        img_table.setStyle(REPORT_IMAGES_TABLE_STYLE)
+        elements.append(img_table)
+    except Exception as e:
+        logger.warning(f"Could not add images to PDF: {e}")
+        elements.append(Paragraph("(Images could not be rendered)", PDF_NORMAL_STYLE))
+    
+    elements.append(Spacer(1, 15))
+    
+    # Sub-Scores Table
+    elements.append(Paragraph("ANALYSIS BREAKDOWN", REPORT_HEADING_STYLE))
+    
+    score_data = [["Metric", "Score", "Details"]]
+    for sub in request.sub_scores:
+        score_data.append([sub.name, f"{sub.score:.1f}%", sub.description])
+    
+    score_table = Table(score_data, colWidths=[1.8*inch, 1*inch, 3.2*inch])
+    score_table.setStyle(REPORT_SCORES_TABLE_STYLE)
+    elements.append(score_table)
+    elements.append(Spacer(1, 15))
+    
+    # AI Analysis (if available)
+    if request.ai_analysis:
+        elements.append(Paragraph("AI DEEP ANALYSIS", REPORT_HEADING_STYLE))
+        # Truncate if too long
+        ai_text = request.ai_analysis[:2000] + "..." if len(request.ai_analysis) > 2000 else request.ai_analysis
+        # Escape markup and keep line breaks in a single pass
+        ai_text = ai_text.translate(AI_TEXT_MARKUP)
+        elements.append(Paragraph(ai_text, PDF_NORMAL_STYLE))
+    
+    # Build PDF
+    doc.build(elements)
+    
+    pdf_bytes = buffer.getvalue()
+    logger.info(f"PDF generated successfully, size: {len(pdf_bytes)} bytes")
+    return pdf_bytes
 
 @api_router.post("/generate-pdf")
 async def generate_pdf_report(request: PDFReportRequest):
     """Generate PDF report for a comparison"""
     try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.units import inch, mm
-        from reportlab.lib import colors
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER, TA_LEFT
-        
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=20*mm, bottomMargin=20*mm)
-        
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=24, alignment=TA_CENTER, spaceAfter=20)
-        heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=14, spaceAfter=10, spaceBefore=15)
-        normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10, spaceAfter=6)
-        score_style = ParagraphStyle('Score', parent=styles['Normal'], fontSize=36, alignment=TA_CENTER, textColor=colors.HexColor('#3b82f6'))
-        verdict_style = ParagraphStyle('Verdict', parent=styles['Normal'], fontSize=16, alignment=TA_CENTER, spaceAfter=20)
-        
-        elements = []
-        
-        # Title
-        elements.append(Paragraph("Handwriting Forensic Analysis Report", title_style))
-        elements.append(Spacer(1, 10))
-        
-        # Timestamp and ID
-        elements.append(Paragraph(f"Report ID: {request.comparison_id}", normal_style))
-        elements.append(Paragraph(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}", normal_style))
-        elements.append(Paragraph("App Version: 1.0.0", normal_style))
-        elements.append(Spacer(1, 20))
-        
-        # Composite Score
-        elements.append(Paragraph("COMPOSITE FORENSIC SCORE", heading_style))
-        
-        # Determine verdict color
-        if request.composite_score >= 88:
-            verdict_color = colors.HexColor('#22c55e')
-        elif request.composite_score >= 70:
-            verdict_color = colors.HexColor('#f59e0b')
-        else:
-            verdict_color = colors.HexColor('#ef4444')
-        
-        score_style_colored = ParagraphStyle('ScoreColored', parent=score_style, textColor=verdict_color)
-        elements.append(Paragraph(f"{request.composite_score:.1f}%", score_style_colored))
-        
-        verdict_style_colored = ParagraphStyle('VerdictColored', parent=verdict_style, textColor=verdict_color)
-        elements.append(Paragraph(request.verdict, verdict_style_colored))
-        elements.append(Spacer(1, 10))
-        
-        # Sample Images
-        elements.append(Paragraph("SAMPLE IMAGES", heading_style))
-        
-        def base64_to_rl_image(b64_str: str, width: float, height: float) -> RLImage:
-            if ',' in b64_str:
-                b64_str = b64_str.split(',')[1]
-            img_data = base64.b64decode(b64_str)
-            img_buffer = io.BytesIO(img_data)
-            return RLImage(img_buffer, width=width, height=height)
-        
-        try:
-            q_img = base64_to_rl_image(request.questioned_thumb, 2*inch, 2*inch)
-            k_img = base64_to_rl_image(request.known_thumb, 2*inch, 2*inch)
-            
-            img_table = Table([
-                [Paragraph("Questioned Document", normal_style), Paragraph("Known Sample", normal_style)],
-                [q_img, k_img]
-            ], colWidths=[3*inch, 3*inch])
-            img_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ]))
-            elements.append(img_table)
-        except Exception as e:
-            logger.warning(f"Could not add images to PDF: {e}")
-            elements.append(Paragraph("(Images could not be rendered)", normal_style))
-        
-        elements.append(Spacer(1, 15))
-        
-        # Sub-Scores Table
-        elements.append(Paragraph("ANALYSIS BREAKDOWN", heading_style))
-        
-        score_data = [["Metric", "Score", "Details"]]
-        for sub in request.sub_scores:
-            score_data.append([
-                sub.get('name', ''),
-                f"{sub.get('score', 0):.1f}%",
-                sub.get('description', '')
-            ])
-        
-        score_table = Table(score_data, colWidths=[1.8*inch, 1*inch, 3.2*inch])
-        score_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e293b')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
-            ('TOPPADDING', (0, 0), (-1, 0), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8fafc')),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#cbd5e1')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
-        ]))
-        elements.append(score_table)
-        elements.append(Spacer(1, 15))
-        
-        # AI Analysis (if available)
-        if request.ai_analysis:
-            elements.append(Paragraph("AI DEEP ANALYSIS", heading_style))
-            # Truncate if too long
-            ai_text = request.ai_analysis[:2000] + "..." if len(request.ai_analysis) > 2000 else request.ai_analysis
-            # Clean up for PDF
-            ai_text = ai_text.replace('\n', '<br/>')
-            elements.append(Paragraph(ai_text, normal_style))
-        
-        # Build PDF
-        doc.build(elements)
-        
-        pdf_bytes = buffer.getvalue()
-        pdf_base64 = base64.b64encode(pdf_bytes).decode()
-        
-        logger.info(f"PDF generated successfully, size: {len(pdf_bytes)} bytes")
+        pdf_bytes = await run_pdf(build_report_pdf, request)
+        pdf_base64 = (await run_cpu(pybase64.b64encode, pdf_bytes)).decode()
         
         return {
             "pdf_base64": pdf_base64,
@@ -1120,6 +1512,19 @@ async def generate_pdf_report(request: PDFReportRequest):
         logger.error(f"PDF generation error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
 
+@api_router.post("/generate-pdf/stream")
+async def stream_pdf_report(request: PDFReportRequest):
+    """Same report as /generate-pdf, returned as the raw PDF (no base64)"""
+    try:
+        pdf_bytes = await run_pdf(build_report_pdf, request)
+        filename = f"forensic_report_{request.comparison_id[:8]}.pdf"
+        return Response(content=pdf_bytes, media_type="application/pdf",
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+        
+    except Exception as e:
+        logger.error(f"PDF generation error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate PDF: {str(e)}")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1131,6 +1536,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_db_indexes():
+    # Backs the sorted /history query and the id lookups
+    try:
+        await db.comparisons.create_index([('timestamp', -1)])
+        await db.comparisons.create_index('id')
+    except Exception as e:
+        logger.warning(f"Could not create MongoDB indexes: {e}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    CV_EXECUTOR.shutdown(wait=False)
+    PDF_EXECUTOR.shutdown(wait=False)
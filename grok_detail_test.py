@@ -5,18 +5,24 @@ Detailed verification of Grok Vision model and response format
 
 import requests
 import json
-import base64
+try:
+    import pybase64 as base64  # SIMD base64, same API as the stdlib module
+except ImportError:
+    import base64
 import io
 from PIL import Image, ImageDraw, ImageFont
 
 # Backend URL
 BACKEND_URL = "https://crop-zoom-app.preview.emergentagent.com/api"
 
+# Loaded once and shared by the sample generators
+DEFAULT_FONT = ImageFont.load_default()
+
 def create_simple_handwriting():
     """Create a simple handwriting sample"""
     img = Image.new('RGB', (300, 150), 'white')
     draw = ImageDraw.Draw(img)
-    font = ImageFont.load_default()
+    font = DEFAULT_FONT
     
     # Simple handwritten text
     draw.text((20, 50), "Test Sample", fill='black', font=font)
@@ -27,27 +33,25 @@ def create_simple_handwriting():
 def image_to_base64(img):
     """Convert PIL image to base64"""
     buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    return base64.b64encode(buffer.getvalue()).decode()
+    img.save(buffer, format='JPEG', quality=85)
+    return base64.b64encode(buffer.getbuffer()).decode('ascii')
 
 def test_detailed_grok_response():
     """Test and analyze detailed Grok response"""
     print("Testing detailed Grok Vision response...")
     
-    # Create test images
-    img1 = create_simple_handwriting()
-    img2 = create_simple_handwriting()
+    # Both samples are the same deterministic image, so encode it once
+    sample_b64 = image_to_base64(create_simple_handwriting())
     
     request_data = {
-        "questioned_image": image_to_base64(img1),
-        "known_image": image_to_base64(img2),
+        "questioned_image": sample_b64,
+        "known_image": sample_b64,
         "use_ai_analysis": True
     }
     
     response = requests.post(
         f"{BACKEND_URL}/compare",
         json=request_data,
-        headers={"Content-Type": "application/json"},
         timeout=60
     )
     